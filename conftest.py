@@ -0,0 +1,15 @@
+"""
+pytest configuration for PiWebcam tests
+
+webcam.py imports picamera at module level. Off the Pi that import fails,
+so stand in a mock once, before any test module imports webcam.
+test_webcam.py still installs its own MockPiCamera when run directly.
+"""
+
+import sys
+from unittest.mock import MagicMock
+
+try:
+	import picamera  # noqa: F401
+except ImportError:
+	sys.modules['picamera'] = MagicMock()
@@ -1,38 +1,108 @@
 #!/usr/bin/python3
 
 import unittest
+import functools
 import io
+import threading
 import time
+from unittest import mock
 from PIL import Image
 import numpy as np
 
 # Import functions and classes to test
-from webcam import compare_frames, MotionDetector
+import webcam
+from webcam import allocate_compare_buffers, compare_arrays, compare_arrays_sad, compare_arrays_three_frame, compare_frames, decode_grayscale, MotionDetector, MotionFrameOutput, StreamingOutput
 
 
-class TestFrameComparison(unittest.TestCase):
-	"""Unit tests for frame comparison logic"""
+@functools.lru_cache(maxsize=None)
+def encode_test_frame(width, height, color, box_color=None, box_size=0):
+	"""
+	Encode a grayscale test JPEG, optionally with a box in the center.
+
+	Encoding is deterministic, so each distinct frame is only encoded once
+	per test run and the same bytes are handed to every test that asks.
+	"""
+	arr = np.full((height, width), color, dtype=np.uint8)
+	if box_color is not None:
+		x_start = (width - box_size) // 2
+		y_start = (height - box_size) // 2
+		arr[y_start:y_start + box_size, x_start:x_start + box_size] = box_color
+	img = Image.fromarray(arr)
+	buffer = io.BytesIO()
+	img.save(buffer, format='JPEG')
+	return buffer.getvalue()
+
+
+class FrameHelpersMixin:
+	"""Test frame helpers shared by the test cases below"""
 
 	def create_test_frame(self, width=100, height=100, color=128):
 		"""Helper to create a test JPEG frame with uniform color"""
-		img = Image.new('L', (width, height), color=color)
-		buffer = io.BytesIO()
-		img.save(buffer, format='JPEG')
-		return buffer.getvalue()
+		return encode_test_frame(width, height, color)
 
 	def create_test_frame_with_box(self, width=100, height=100, bg_color=128, box_color=255, box_size=20):
 		"""Helper to create a test frame with a white box in the center"""
-		img = Image.new('L', (width, height), color=bg_color)
-		# Draw a box in the center
-		pixels = img.load()
-		x_start = (width - box_size) // 2
-		y_start = (height - box_size) // 2
-		for x in range(x_start, x_start + box_size):
-			for y in range(y_start, y_start + box_size):
-				pixels[x, y] = box_color
+		return encode_test_frame(width, height, bg_color, box_color, box_size)
+
+
+class TestFrameComparison(FrameHelpersMixin, unittest.TestCase):
+	"""Unit tests for frame comparison logic"""
+
+	def test_decode_grayscale(self):
+		"""Test that frames decode to a 2-D uint8 grayscale array"""
+		frame = self.create_test_frame(width=120, height=80, color=200)
+		arr = decode_grayscale(frame)
+		self.assertEqual(arr.shape, (80, 120))
+		self.assertEqual(arr.dtype, np.uint8)
+		self.assertTrue(abs(int(arr.mean()) - 200) <= 2)
+
+	def test_decode_grayscale_downscale(self):
+		"""Test that decode-time downscaling shrinks large frames but not small ones"""
+		large = self.create_test_frame(width=640, height=480)
+		self.assertEqual(decode_grayscale(large, downscale=4).shape, (120, 160))
+		# Never scaled below MOTION_MIN_DECODE_WIDTH
+		self.assertEqual(decode_grayscale(large, downscale=8).shape, (120, 160))
+		small = self.create_test_frame(width=100, height=100)
+		self.assertEqual(decode_grayscale(small, downscale=4).shape, (100, 100))
+
+	def test_decode_grayscale_fixed_size(self):
+		"""Test decoding to a fixed thumbnail size regardless of frame resolution"""
+		for width, height in ((640, 480), (1280, 720), (100, 100)):
+			frame = self.create_test_frame(width=width, height=height, color=90)
+			arr = decode_grayscale(frame, size=(160, 120))
+			self.assertEqual(arr.shape, (120, 160))
+			self.assertEqual(arr.dtype, np.uint8)
+			self.assertLess(abs(int(arr.mean()) - 90), 3)
+
+	def test_decode_grayscale_colour_frame(self):
+		"""Test colour JPEGs decode to their luma plane on the PIL path"""
+		rgb = np.zeros((120, 160, 3), dtype=np.uint8)
+		rgb[:, :, 1] = 200
 		buffer = io.BytesIO()
-		img.save(buffer, format='JPEG')
-		return buffer.getvalue()
+		Image.fromarray(rgb).save(buffer, format='JPEG')
+		frame = buffer.getvalue()
+		expected = np.asarray(Image.open(io.BytesIO(frame)).convert('L'), dtype=np.int16)
+
+		with mock.patch('webcam.turbo_jpeg', None), mock.patch('webcam.cv2', None):
+			arr = decode_grayscale(frame)
+
+		self.assertEqual(arr.shape, (120, 160))
+		self.assertEqual(arr.dtype, np.uint8)
+		self.assertLessEqual(np.abs(arr.astype(np.int16) - expected).max(), 2)
+
+	def test_decode_grayscale_opencv_backoff(self):
+		"""Test the OpenCV path backs off a reduced decode below the minimum width"""
+		decoded_widths = {8: 80, 4: 160}
+		fake_cv2 = mock.MagicMock()
+		fake_cv2.imdecode.side_effect = lambda buf, flag: np.zeros((60, decoded_widths[flag]), dtype=np.uint8)
+
+		with mock.patch('webcam.turbo_jpeg', None), \
+				mock.patch('webcam.cv2', fake_cv2), \
+				mock.patch('webcam.CV2_REDUCED_GRAYSCALE', {8: 8, 4: 4}, create=True):
+			arr = decode_grayscale(b'jpeg', downscale=8)
+
+		self.assertEqual(arr.shape, (60, 160))
+		self.assertEqual(fake_cv2.imdecode.call_count, 2)
 
 	def test_identical_frames(self):
 		"""Test that identical frames return 0% change"""
@@ -40,6 +110,14 @@ class TestFrameComparison(unittest.TestCase):
 		percentage = compare_frames(frame, frame)
 		self.assertEqual(percentage, 0.0)
 
+	def test_identical_frames_skip_decode(self):
+		"""Test that equal inputs are recognised without decoding either frame"""
+		frame = self.create_test_frame(color=128)
+		with mock.patch('webcam.decode_grayscale') as decode:
+			self.assertEqual(compare_frames(frame, frame), 0.0)
+			self.assertEqual(compare_frames(frame, bytes(bytearray(frame))), 0.0)
+		decode.assert_not_called()
+
 	def test_none_frames(self):
 		"""Test that None frames return 0% change"""
 		frame = self.create_test_frame()
@@ -85,6 +163,94 @@ class TestFrameComparison(unittest.TestCase):
 		percentage = compare_frames(frame, invalid_data)
 		self.assertEqual(percentage, 0.0)
 
+	def test_compare_arrays_no_uint8_wraparound(self):
+		"""Test that differences are absolute in both directions without uint8 overflow"""
+		dark = np.zeros((10, 10), dtype=np.uint8)
+		bright = np.full((10, 10), 250, dtype=np.uint8)
+		self.assertEqual(compare_arrays(dark, bright), 100.0)
+		self.assertEqual(compare_arrays(bright, dark), 100.0)
+		self.assertEqual(compare_arrays(bright, dark, threshold=250.0), 0.0)
+
+	def test_compare_arrays_fractional_and_out_of_range_thresholds(self):
+		"""Test non-integer and out-of-range pixel thresholds behave like a float comparison"""
+		arr1 = np.zeros((1, 4), dtype=np.uint8)
+		arr2 = np.array([[5, 6, 7, 255]], dtype=np.uint8)
+		self.assertEqual(compare_arrays(arr1, arr2, threshold=5.5), 75.0)  # 6, 7, 255
+		self.assertEqual(compare_arrays(arr1, arr2, threshold=6.0), 50.0)  # 7, 255
+		self.assertEqual(compare_arrays(arr1, arr2, threshold=-1.0), 100.0)
+		self.assertEqual(compare_arrays(arr1, arr2, threshold=300.0), 0.0)
+
+	def test_compare_arrays_with_buffers(self):
+		"""Test that preallocated buffers give the same results as fresh arrays"""
+		rng = np.random.default_rng(0)
+		arr1 = rng.integers(0, 256, (40, 30), dtype=np.uint8)
+		arr2 = rng.integers(0, 256, (40, 30), dtype=np.uint8)
+		buffers = allocate_compare_buffers(arr1.shape)
+		self.assertEqual(compare_arrays(arr1, arr2, 20.0, buffers), compare_arrays(arr1, arr2, 20.0))
+		self.assertEqual(compare_arrays_sad(arr1, arr2, buffers), compare_arrays_sad(arr1, arr2))
+
+	def test_compare_arrays_stop_at(self):
+		"""Test banded compare stops early but never under-reports the decision"""
+		arr1 = np.zeros((256, 100), dtype=np.uint8)
+		arr2 = np.full((256, 100), 255, dtype=np.uint8)
+		buffers = allocate_compare_buffers(arr1.shape)
+
+		self.assertAlmostEqual(compare_arrays(arr1, arr2), 100.0)
+		# Stops after the first 64-row band
+		self.assertAlmostEqual(compare_arrays(arr1, arr2, stop_at=10.0), 25.0)
+		self.assertAlmostEqual(compare_arrays(arr1, arr2, buffers=buffers, stop_at=10.0), 25.0)
+
+		# Change confined to the last band is still found
+		arr3 = arr1.copy()
+		arr3[-10:] = 255
+		self.assertAlmostEqual(compare_arrays(arr1, arr3, buffers=buffers, stop_at=50.0), 10 * 100.0 / 256)
+
+	def test_compare_arrays_opencv_kernels(self):
+		"""Test compare_arrays uses OpenCV's absdiff/compare/countNonZero when available"""
+		def absdiff(a, b, dst=None):
+			result = np.maximum(a, b) - np.minimum(a, b)
+			if dst is not None:
+				dst[...] = result
+				return dst
+			return result
+
+		fake_cv2 = mock.MagicMock()
+		fake_cv2.absdiff.side_effect = absdiff
+		fake_cv2.compare.side_effect = lambda src, value, op, dst=None: (src > value).astype(np.uint8) * 255
+		fake_cv2.countNonZero.side_effect = np.count_nonzero
+
+		arr1 = np.array([[0, 10], [250, 100]], dtype=np.uint8)
+		arr2 = np.array([[10, 0], [100, 104]], dtype=np.uint8)
+		expected = compare_arrays(arr1, arr2, threshold=5.0)
+		with mock.patch('webcam.cv2', fake_cv2):
+			self.assertAlmostEqual(compare_arrays(arr1, arr2, threshold=5.0), expected)
+			self.assertAlmostEqual(
+				compare_arrays(arr1, arr2, threshold=5.0, buffers=allocate_compare_buffers(arr1.shape)),
+				expected
+			)
+		self.assertEqual(fake_cv2.countNonZero.call_count, 2)
+
+	def test_compare_arrays_sad(self):
+		"""Test SAD comparison reports mean difference as a percentage of full scale"""
+		dark = np.zeros((10, 10), dtype=np.uint8)
+		bright = np.full((10, 10), 255, dtype=np.uint8)
+		half = np.full((10, 10), 51, dtype=np.uint8)
+		self.assertEqual(compare_arrays_sad(dark, dark), 0.0)
+		self.assertEqual(compare_arrays_sad(bright, dark), 100.0)
+		self.assertAlmostEqual(compare_arrays_sad(dark, half), 20.0)
+
+	def test_compare_arrays_three_frame(self):
+		"""Test three-frame differencing counts passing objects but not lasting changes"""
+		background = np.full((10, 10), 100, dtype=np.uint8)
+		passing = background.copy()
+		passing[:5] = 200  # Object present in the middle frame only
+		self.assertEqual(compare_arrays_three_frame(background, passing, background), 50.0)
+
+		# A brightness step that persists changes arr0->arr2 too, so is ignored
+		brighter = np.full((10, 10), 150, dtype=np.uint8)
+		self.assertEqual(compare_arrays_three_frame(background, brighter, brighter), 0.0)
+		self.assertEqual(compare_arrays_three_frame(background, background, brighter), 0.0)
+
 	def test_different_size_frames(self):
 		"""Test comparison of frames with different sizes"""
 		frame1 = self.create_test_frame(width=100, height=100)
@@ -95,16 +261,9 @@ class TestFrameComparison(unittest.TestCase):
 		self.assertLessEqual(percentage, 100.0)
 
 
-class TestMotionDetector(unittest.TestCase):
+class TestMotionDetector(FrameHelpersMixin, unittest.TestCase):
 	"""Unit tests for MotionDetector state machine"""
 
-	def create_test_frame(self, width=100, height=100, color=128):
-		"""Helper to create a test JPEG frame"""
-		img = Image.new('L', (width, height), color=color)
-		buffer = io.BytesIO()
-		img.save(buffer, format='JPEG')
-		return buffer.getvalue()
-
 	def test_initialization(self):
 		"""Test MotionDetector initializes correctly"""
 		detector = MotionDetector(threshold=10.0, cooldown_seconds=3.0)
@@ -113,6 +272,89 @@ class TestMotionDetector(unittest.TestCase):
 		self.assertEqual(detector.state, MotionDetector.STATE_IDLE)
 		self.assertEqual(detector.motion_event_count, 0)
 
+	def test_uses_slots(self):
+		"""Test the detector has no per-instance __dict__"""
+		detector = MotionDetector()
+		self.assertFalse(hasattr(detector, '__dict__'))
+		with self.assertRaises(AttributeError):
+			detector.thresold = 1.0  # Typo is caught rather than silently ignored
+
+	def test_thumbnail_size_detects_motion(self):
+		"""Test motion detection comparing fixed-size thumbnails"""
+		detector = MotionDetector(threshold=5.0, thumbnail_size=(160, 120))
+		detector.check_motion(self.create_test_frame(width=640, height=480, color=128))
+		motion_detected, change = detector.check_motion(self.create_test_frame(width=640, height=480, color=255))
+		self.assertTrue(motion_detected)
+		self.assertEqual(detector.previous_array.shape, (120, 160))
+
+	def test_thumbnail_size_preallocates_compare_buffers(self):
+		"""Test a fixed thumbnail size allocates compare buffers once, up front"""
+		detector = MotionDetector(threshold=5.0, thumbnail_size=(160, 120))
+		buffers = detector._compare_buffers
+		self.assertEqual(buffers[0].shape, (120, 160))
+
+		for color in (128, 255, 128):
+			detector.check_motion(self.create_test_frame(width=640, height=480, color=color))
+		self.assertIs(detector._compare_buffers, buffers)
+
+	def test_array_frames_skip_decode(self):
+		"""Test grayscale arrays (e.g. from the YUV port) are compared without decoding"""
+		detector = MotionDetector(threshold=5.0)
+		with mock.patch('webcam.decode_grayscale') as decode:
+			detector.check_motion(np.full((120, 160), 128, dtype=np.uint8))
+			motion_detected, change = detector.check_motion(np.full((120, 160), 255, dtype=np.uint8))
+		self.assertTrue(motion_detected)
+		decode.assert_not_called()
+
+	def test_size_skip_ratio_skips_similar_sized_frames(self):
+		"""Test frames of near-identical JPEG size are skipped while idle, and slow drift still counts"""
+		detector = MotionDetector(threshold=5.0, size_skip_ratio=0.02)
+		with mock.patch('webcam.decode_grayscale', return_value=np.zeros((4, 4), dtype=np.uint8)) as decode:
+			detector.check_motion(b'\xff\xd8' + bytes(1000))
+			self.assertEqual(detector.check_motion(b'\xff\xd8' + bytes(1010)), (False, 0.0))
+			self.assertEqual(decode.call_count, 1)
+
+			# Compared against the last compared frame, not the skipped one
+			detector.check_motion(b'\xff\xd8' + bytes(1025))
+			self.assertEqual(decode.call_count, 2)
+
+	def test_size_skip_disabled_by_default(self):
+		"""Test every frame is decoded when no size skip ratio is set"""
+		detector = MotionDetector(threshold=5.0)
+		with mock.patch('webcam.decode_grayscale', return_value=np.zeros((4, 4), dtype=np.uint8)) as decode:
+			detector.check_motion(b'\xff\xd8' + bytes(1000))
+			detector.check_motion(b'\xff\xd8' + bytes(1001))
+		self.assertEqual(decode.call_count, 2)
+
+	def test_three_frame_detection(self):
+		"""Test three-frame mode triggers on a passing object, not on a lighting change"""
+		background = np.full((20, 20), 100, dtype=np.uint8)
+		passing = background.copy()
+		passing[5:15, 5:15] = 250
+
+		detector = MotionDetector(threshold=5.0, three_frame=True)
+		self.assertEqual(detector.get_status()['metric'], 'three_frame')
+		for frame in (background, np.full((20, 20), 160, dtype=np.uint8), np.full((20, 20), 160, dtype=np.uint8)):
+			motion_detected, _ = detector.check_motion(frame)
+			self.assertFalse(motion_detected)
+
+		detector = MotionDetector(threshold=5.0, three_frame=True)
+		detector.check_motion(background)
+		detector.check_motion(passing)
+		motion_detected, change = detector.check_motion(background)
+		self.assertTrue(motion_detected)
+		self.assertEqual(change, 25.0)
+
+	def test_three_frame_and_sad_rejected(self):
+		"""Test three-frame differencing cannot be combined with the SAD metric"""
+		with self.assertRaises(ValueError):
+			MotionDetector(fast_sad=True, three_frame=True)
+
+	def test_invalid_downscale_rejected(self):
+		"""Test that unsupported decode scales are rejected"""
+		with self.assertRaises(ValueError):
+			MotionDetector(downscale=3)
+
 	def test_first_frame_no_motion(self):
 		"""Test that first frame doesn't trigger motion (no previous frame)"""
 		detector = MotionDetector(threshold=5.0)
@@ -150,6 +392,19 @@ class TestMotionDetector(unittest.TestCase):
 		self.assertEqual(detector.motion_event_count, 1)
 		self.assertIsNotNone(detector.last_motion_time)
 
+	def test_motion_detection_trigger_sad(self):
+		"""Test that SAD metric also triggers on significant change"""
+		detector = MotionDetector(threshold=5.0, fast_sad=True)
+		detector.check_motion(self.create_test_frame(color=128))
+
+		motion_detected, change_pct = detector.check_motion(self.create_test_frame(color=128))
+		self.assertFalse(motion_detected)
+
+		motion_detected, change_pct = detector.check_motion(self.create_test_frame(color=255))
+		self.assertTrue(motion_detected)
+		self.assertGreater(change_pct, 40.0)
+		self.assertEqual(detector.get_status()['metric'], 'sad')
+
 	def test_motion_event_counter(self):
 		"""Test that motion event counter increments correctly"""
 		detector = MotionDetector(threshold=5.0, cooldown_seconds=0.1)
@@ -195,6 +450,22 @@ class TestMotionDetector(unittest.TestCase):
 		self.assertFalse(motion_detected)  # Should be blocked by cooldown
 		self.assertEqual(detector.motion_event_count, 1)  # Counter should not increment
 
+	def test_cooldown_ignores_wall_clock_jumps(self):
+		"""Test that a wall-clock change (e.g. NTP sync) does not end cooldown early"""
+		detector = MotionDetector(threshold=5.0, cooldown_seconds=1.0)
+		frame_still = self.create_test_frame(color=128)
+		frame_motion = self.create_test_frame(color=255)
+
+		detector.check_motion(frame_still)
+		detector.check_motion(frame_motion)
+		detector.check_motion(frame_still)
+		self.assertEqual(detector.state, MotionDetector.STATE_COOLDOWN)
+
+		with mock.patch('webcam.time.time', return_value=time.time() + 3600):
+			motion_detected, _ = detector.check_motion(frame_motion)
+		self.assertFalse(motion_detected)
+		self.assertEqual(detector.motion_event_count, 1)
+
 	def test_cooldown_expires(self):
 		"""Test that cooldown expires after configured time"""
 		detector = MotionDetector(threshold=5.0, cooldown_seconds=0.1)
@@ -220,6 +491,50 @@ class TestMotionDetector(unittest.TestCase):
 		self.assertTrue(motion_detected)
 		self.assertEqual(detector.motion_event_count, 2)
 
+	def test_each_frame_decoded_once(self):
+		"""Test that previous/baseline frames are cached decoded, not re-decoded"""
+		detector = MotionDetector(threshold=5.0)
+		frame_still = self.create_test_frame(color=128)
+		frame_motion = self.create_test_frame(color=255)
+
+		with mock.patch('webcam.decode_grayscale', wraps=webcam.decode_grayscale) as decode:
+			detector.check_motion(frame_still)   # Baseline
+			detector.check_motion(frame_motion)  # Motion start (compare to previous)
+			detector.check_motion(self.create_test_frame(color=250))  # Motion ongoing (compare to baseline)
+			self.assertEqual(decode.call_count, 3)
+
+	def test_identical_bytes_skip_decode(self):
+		"""Test that a byte-identical repeat of the last frame is not decoded again"""
+		detector = MotionDetector(threshold=5.0)
+		frame_still = self.create_test_frame(color=128)
+		frame_motion = self.create_test_frame(color=255)
+
+		with mock.patch('webcam.decode_grayscale', wraps=webcam.decode_grayscale) as decode:
+			detector.check_motion(frame_still)
+			self.assertEqual(detector.check_motion(bytes(frame_still)), (False, 0.0))
+			motion, _ = detector.check_motion(frame_motion)
+			self.assertTrue(motion)
+			# Repeat while motion is ongoing still compares against the baseline
+			motion, _ = detector.check_motion(frame_motion)
+			self.assertTrue(motion)
+			self.assertEqual(decode.call_count, 2)
+
+	def test_decode_runs_outside_state_lock(self):
+		"""Test that JPEG decoding does not hold the state lock"""
+		detector = MotionDetector(threshold=5.0)
+		real_decode = webcam.decode_grayscale
+		lock_held = []
+
+		def decode(frame_bytes, downscale=1, size=None):
+			lock_held.append(detector.state_lock.locked())
+			return real_decode(frame_bytes, downscale, size)
+
+		with mock.patch('webcam.decode_grayscale', side_effect=decode):
+			detector.check_motion(self.create_test_frame(color=128))
+			detector.check_motion(self.create_test_frame(color=255))
+
+		self.assertEqual(lock_held, [False, False])
+
 	def test_get_status(self):
 		"""Test get_status returns correct information"""
 		detector = MotionDetector(threshold=7.5, cooldown_seconds=3.0)
@@ -232,6 +547,20 @@ class TestMotionDetector(unittest.TestCase):
 		self.assertEqual(status['state'], MotionDetector.STATE_IDLE)
 		self.assertEqual(status['motion_event_count'], 0)
 
+	@unittest.skipIf(webcam.orjson is None, "orjson not installed")
+	def test_status_serialises_with_orjson(self):
+		"""get_status after a compare should serialise with the real orjson"""
+		frames = [np.full((48, 64), 100, dtype=np.uint8) for _ in range(3)]
+		frames[1][:10] = 200
+		for options in ({}, {'fast_sad': True}, {'three_frame': True}):
+			with self.subTest(**options):
+				detector = MotionDetector(**options)
+				for frame in frames:
+					detector.check_motion(frame)
+				status = detector.get_status()
+				self.assertIs(type(status['last_change_percentage']), float)
+				self.assertEqual(webcam.orjson.loads(webcam.json_body(status)), status)
+
 	def test_is_motion_active(self):
 		"""Test is_motion_active() returns correct state"""
 		detector = MotionDetector(threshold=5.0)
@@ -282,6 +611,237 @@ class TestMotionDetector(unittest.TestCase):
 
 		# If we get here without deadlock or exception, thread safety is working
 
+	def test_status_reads_do_not_wait_for_state_lock(self):
+		"""Test get_status/is_motion_active answer while a frame holds the lock"""
+		detector = MotionDetector(threshold=5.0)
+		results = []
+
+		def read_status():
+			results.append((detector.get_status()['state'], detector.is_motion_active()))
+
+		with detector.state_lock:
+			reader = threading.Thread(target=read_status)
+			reader.start()
+			reader.join(timeout=1.0)
+
+		self.assertEqual(results, [(MotionDetector.STATE_IDLE, False)])
+
+
+class TestMotionFrameOutput(unittest.TestCase):
+	"""Unit tests for the raw YUV motion frame output"""
+
+	def test_write_keeps_unpadded_luma_plane(self):
+		"""Test the Y plane is extracted without the camera's row/column padding"""
+		output = MotionFrameOutput((100, 70))
+		self.assertEqual((output.stride, output.padded_height), (128, 80))
+
+		# YUV420: padded Y plane followed by quarter-size U and V planes
+		y_plane = np.zeros((80, 128), dtype=np.uint8)
+		y_plane[:70, :100] = 200
+		buf = y_plane.tobytes() + bytes(128 * 80 // 2)
+		output.write(buf)
+
+		self.assertEqual(output.frame.shape, (70, 100))
+		self.assertTrue((output.frame == 200).all())
+
+
+def wait_until(predicate, timeout=2.0):
+	"""Poll predicate until it holds, failing the test after timeout seconds"""
+	deadline = time.monotonic() + timeout
+	while not predicate():
+		if time.monotonic() > deadline:
+			raise AssertionError("Timed out waiting for the loop thread")
+		time.sleep(0.001)
+
+
+class LoopStopped(BaseException):
+	"""Raised into a loop thread to end it; the loops only catch Exception"""
+
+
+class StoppableOutput(StreamingOutput):
+	"""
+	StreamingOutput that records each loop's waits and can end the loops.
+
+	webcam's loop threads run forever; once stop() is called, their next
+	wait_for_frame raises LoopStopped, so the thread ends and can be joined.
+	"""
+	def __init__(self):
+		super().__init__()
+		self.stopped = False
+		self.waits = {}  # thread name -> number of wait_for_frame calls
+
+	def wait_for_frame(self, last_seq, timeout=None):
+		name = threading.current_thread().name
+		self.waits[name] = self.waits.get(name, 0) + 1
+		result = super().wait_for_frame(last_seq, timeout)
+		if self.stopped:
+			raise LoopStopped
+		return result
+
+	def stop(self):
+		"""Wake every waiting loop so it exits"""
+		with self.condition:
+			self.stopped = True
+			self.seq += 1
+			self.condition.notify_all()
+
+
+class TestMotionLoop(unittest.TestCase):
+	"""Unit tests for motion_loop, run on a thread against a real StreamingOutput"""
+
+	def setUp(self):
+		self.output = StoppableOutput()
+		self.detector = mock.Mock(spec=MotionDetector)
+		self.detector.check_motion.return_value = (False, 0.0)
+		self.detector.state = MotionDetector.STATE_IDLE
+		self.detector.threshold = 5.0
+		self.threads = []
+		patcher = mock.patch.multiple(webcam, streaming_output=self.output,
+			motion_detector=self.detector, motion_output=None, MOTION_SAMPLE_EVERY=1)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		# Runs before the patches are undone, so the loops never see the real globals
+		self.addCleanup(self.stop_threads)
+
+	def start(self, target, name):
+		def run():
+			try:
+				target()
+			except LoopStopped:
+				pass
+		thread = threading.Thread(target=run, name=name, daemon=True)
+		thread.start()
+		self.threads.append(thread)
+
+	def stop_threads(self):
+		self.output.stop()
+		for thread in self.threads:
+			thread.join(timeout=2.0)
+			self.assertFalse(thread.is_alive())
+
+	def publish(self, name, count=1):
+		"""Write count frames, returning the last"""
+		for i in range(count):
+			frame = b'\xff\xd8' + name + b'%d' % i + b'\xff\xd9'
+			self.output.write(frame)
+		return frame
+
+	def publish_and_settle(self, name):
+		"""Write one frame and wait until motion_loop is waiting for the next"""
+		waits = self.output.waits.get('motion', 0)
+		frame = self.publish(name)
+		wait_until(lambda: self.output.waits.get('motion', 0) > waits)
+		return frame
+
+	def publish_and_settle_all(self, name, threads):
+		"""Write one frame and wait until each named loop is waiting for the next"""
+		waits = {thread: self.output.waits.get(thread, 0) for thread in threads}
+		start = time.monotonic()
+		frame = self.publish(name)
+		elapsed = time.monotonic() - start
+		for thread in threads:
+			wait_until(lambda: self.output.waits.get(thread, 0) > waits[thread])
+		return frame, elapsed
+
+	def test_detection_sees_published_frame(self):
+		"""Each frame written to the stream should reach check_motion"""
+		self.start(webcam.motion_loop, 'motion')
+		wait_until(lambda: 'motion' in self.output.waits)
+
+		frame = self.publish_and_settle(b'first')
+		self.detector.check_motion.assert_called_once_with(frame)
+		frame = self.publish_and_settle(b'second')
+		self.detector.check_motion.assert_called_with(frame)
+
+	def test_yuv_plane_used_when_motion_output_set(self):
+		"""With a motion port, detection gets its Y plane; snapshots still get the JPEG"""
+		y_plane = np.zeros((48, 64), dtype=np.uint8)
+		self.detector.check_motion.return_value = (True, 42.0)
+		self.detector.motion_event_count = 1
+		with mock.patch.object(webcam, 'motion_output', mock.Mock(frame=y_plane)), \
+				mock.patch.object(webcam, 'MOTION_SNAPSHOT_ENABLED', True), \
+				mock.patch.object(webcam, 'save_motion_snapshot') as save_snapshot:
+			self.start(webcam.motion_loop, 'motion')
+			wait_until(lambda: 'motion' in self.output.waits)
+			frame = self.publish_and_settle(b'frame')
+			self.stop_threads()
+
+		self.detector.check_motion.assert_called_once_with(y_plane)
+		save_snapshot.assert_called_once_with(frame)
+
+	def test_slow_detection_does_not_hold_back_stream(self):
+		"""A slow check_motion should not delay frame writes or monitoring_loop"""
+		release = threading.Event()
+		self.addCleanup(release.set)
+		self.detector.check_motion.side_effect = lambda frame: (release.wait(2.0), (False, 0.0))[1]
+		self.start(webcam.motion_loop, 'motion')
+		self.start(webcam.monitoring_loop, 'monitor')
+		wait_until(lambda: 'motion' in self.output.waits and 'monitor' in self.output.waits)
+
+		self.publish(b'busy')
+		wait_until(lambda: self.detector.check_motion.call_count == 1)
+
+		# check_motion is now blocked: frames must still be published and
+		# counted by the monitoring loop one by one
+		monitor_waits = self.output.waits['monitor']
+		for i in range(5):
+			_, elapsed = self.publish_and_settle_all(b'f%d' % i, ['monitor'])
+			self.assertLess(elapsed, 0.1)
+		self.assertEqual(self.output.seq, 6)
+		self.assertEqual(self.output.waits['monitor'], monitor_waits + 5)
+		self.assertEqual(self.detector.check_motion.call_count, 1)
+
+		# Once free, detection moves on to the newest frame, not the backlog
+		waits = self.output.waits['motion']
+		release.set()
+		wait_until(lambda: self.output.waits['motion'] > waits + 1)
+		self.assertEqual(self.detector.check_motion.call_count, 2)
+		self.detector.check_motion.assert_called_with(b'\xff\xd8f40\xff\xd9')
+
+	def test_samples_every_nth_frame(self):
+		"""check_motion should run once per MOTION_SAMPLE_EVERY frames"""
+		webcam.MOTION_SAMPLE_EVERY = 3
+		self.start(webcam.motion_loop, 'motion')
+		wait_until(lambda: 'motion' in self.output.waits)
+
+		for i in range(9):
+			self.publish_and_settle(b'f%d' % i)
+
+		self.assertEqual(self.detector.check_motion.call_count, 3)
+
+	def test_sampling_counts_frames_not_wakeups(self):
+		"""Frames published during a slow check should count towards the interval"""
+		webcam.MOTION_SAMPLE_EVERY = 2
+		release = threading.Event()
+		self.detector.check_motion.side_effect = lambda frame: (release.wait(2.0), (False, 0.0))[1]
+		self.start(webcam.motion_loop, 'motion')
+		wait_until(lambda: 'motion' in self.output.waits)
+
+		self.publish_and_settle(b'a')
+		self.publish(b'b')
+		wait_until(lambda: self.detector.check_motion.call_count == 1)
+
+		# Three frames while the check is busy, seen by the loop in one wakeup
+		latest = self.publish(b'c', count=3)
+		waits = self.output.waits['motion']
+		release.set()
+		wait_until(lambda: self.output.waits['motion'] > waits + 1)
+
+		self.assertEqual(self.detector.check_motion.call_count, 2)
+		self.detector.check_motion.assert_called_with(latest)
+
+	def test_sample_every_below_one_rejected(self):
+		"""--motion-sample-every should reject 0 and negative intervals"""
+		for value in ('0', '-2'):
+			with self.subTest(value=value), \
+					mock.patch('sys.argv', ['webcam.py', '--motion-sample-every', value]), \
+					mock.patch('sys.stderr', io.StringIO()):
+				with self.assertRaises(SystemExit):
+					webcam.parse_args()
+
+		with mock.patch('sys.argv', ['webcam.py', '--motion-sample-every', '4']):
+			self.assertEqual(webcam.parse_args().motion_sample_every, 4)
+
 
 if __name__ == '__main__':
 	unittest.main()
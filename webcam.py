@@ -1,13 +1,20 @@
 #!/usr/bin/python3
 
 import io
+import json
 import os
 import sys
 import time
 import threading
 import base64
+import collections
+import email.utils
+import functools
+import hmac
 import argparse
 import logging
+import math
+import socket
 import ssl
 from picamera import PiCamera
 
@@ -25,8 +32,35 @@ except ImportError as e:
 	MOTION_DETECTION_AVAILABLE = False
 	MOTION_DETECTION_IMPORT_ERROR = str(e)
 
+# Optional libjpeg-turbo binding for faster motion detection decoding
+try:
+	from turbojpeg import TurboJPEG, TJPF_GRAY
+	turbo_jpeg = TurboJPEG()
+except (ImportError, RuntimeError, OSError):
+	# Module missing, or libturbojpeg shared library not found
+	turbo_jpeg = None
+
+# Optional OpenCV, used for motion detection decoding when TurboJPEG is not available
+try:
+	import cv2
+	CV2_REDUCED_GRAYSCALE = {
+		1: cv2.IMREAD_GRAYSCALE,
+		2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+		4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+		8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+	}
+except ImportError:
+	cv2 = None
+
+# Optional orjson, a faster JSON encoder for the status endpoints
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
 # Global variables (will be set by parse_args or defaults)
 camera = None
+camera_info = None  # Static camera details for /health, set by initialize_camera()
 HOST_NAME = None
 PORT_NUMBER = None
 AUTH_USER = None
@@ -34,10 +68,6 @@ AUTH_PASS = None
 AUTH_ENABLED = False
 JPEG_QUALITY = 85
 
-# In-memory storage for current frame (legacy, for /webcam.jpg compatibility)
-current_frame = None
-frame_lock = threading.Lock()
-
 # Global performance metrics
 stream_fps = 0.0
 fps_lock = threading.Lock()
@@ -47,32 +77,363 @@ class StreamingOutput:
 	"""Thread-safe output for MJPEG streaming"""
 	def __init__(self):
 		self.frame = None
-		self.buffer = io.BytesIO()
+		self.seq = 0  # Incremented for every published frame
 		self.condition = threading.Condition()
+		self._parts = []  # Pieces of a frame split across several writes
 
 	def write(self, buf):
-		"""Called by camera for each MJPEG frame"""
+		"""
+		Called by camera with encoder output.
+
+		Each write is normally one whole JPEG (SOI ... EOI), published as is.
+		A frame the encoder splits over several writes is collected until its
+		EOI marker, or until the next SOI if it never ends with one.
+		"""
 		if buf.startswith(b'\xff\xd8'):
-			# New frame, store the previous complete frame
-			with self.condition:
-				self.buffer.truncate()
-				self.buffer.seek(0)
-				self.buffer.write(buf)
-				self.frame = self.buffer.getvalue()
-				self.condition.notify_all()
+			if self._parts:
+				self._publish(b''.join(self._parts))
+				self._parts = []
+			if buf.endswith(b'\xff\xd9'):
+				# Whole frame. picamera already hands over bytes, so this is
+				# normally a reference, not a copy
+				self._publish(buf if type(buf) is bytes else bytes(buf))
+			else:
+				self._parts.append(bytes(buf))
+		elif self._parts:
+			self._parts.append(bytes(buf))
+			if buf.endswith(b'\xff\xd9'):
+				self._publish(b''.join(self._parts))
+				self._parts = []
+
+	def _publish(self, frame):
+		"""Make frame (immutable bytes) the latest frame and wake waiting consumers"""
+		with self.condition:
+			self.frame = frame
+			self.seq += 1
+			self.condition.notify_all()
+
+	def wait_for_frame(self, last_seq, timeout=None):
+		"""
+		Wait for a frame newer than the one the caller last handled.
+
+		Returns at once if a newer frame was published while the caller was
+		busy (e.g. still sending the previous frame), rather than waiting for
+		the one after it.
+
+		Args:
+			last_seq: seq returned by the previous call, or 0 for none
+			timeout: Maximum seconds to wait, or None to wait indefinitely
+
+		Returns:
+			Tuple of (seq, frame bytes), or (last_seq, None) on timeout
+		"""
+		with self.condition:
+			if not self.condition.wait_for(lambda: self.seq != last_seq, timeout):
+				return last_seq, None
+			return self.seq, self.frame
 
 streaming_output = StreamingOutput()
 
+# Raw output for motion detection frames
+class MotionFrameOutput:
+	"""Keeps the luma plane of the latest YUV420 frame from a resized camera port"""
+	def __init__(self, size):
+		"""
+		Args:
+			size: (width, height) the camera port resizes frames to
+		"""
+		self.size = tuple(size)
+		width, height = self.size
+		# The camera pads YUV frames to a multiple of 32 columns and 16 rows
+		self.stride = (width + 31) // 32 * 32
+		self.padded_height = (height + 15) // 16 * 16
+		self.frame = None
+
+	def write(self, buf):
+		"""Called by camera for each YUV frame"""
+		width, height = self.size
+		y_plane = np.frombuffer(buf, dtype=np.uint8, count=self.stride * self.padded_height)
+		# A view into the frame buffer; rebound, never mutated, like StreamingOutput.frame
+		self.frame = y_plane.reshape(self.padded_height, self.stride)[:height, :width]
+
+# YUV output feeding motion detection (None when motion uses the MJPEG frames)
+motion_output = None
+
 # Motion detector instance (None if disabled)
 motion_detector = None
 
 # Motion snapshot configuration (in-memory storage)
 MOTION_SNAPSHOT_ENABLED = False
 MOTION_SNAPSHOT_LIMIT = 0
-snapshot_history = []  # List of (timestamp, bytes) tuples - stored in RAM
+# (timestamp, bytes) tuples stored in RAM, oldest first. main() rebinds it
+# with maxlen=MOTION_SNAPSHOT_LIMIT, so appending drops the oldest in O(1)
+snapshot_history = collections.deque()
 snapshot_lock = threading.Lock()  # Protect snapshot_history
 
 # Motion detection functions
+# Smallest width a motion frame is downscaled to during decode
+MOTION_MIN_DECODE_WIDTH = 160
+
+def _decode_scale(width, height, downscale, min_size):
+	"""Largest power-of-two scale up to downscale that keeps the frame at least min_size (width, height)"""
+	scale = 1
+	while (scale < downscale and width // (scale * 2) >= min_size[0]
+			and height // (scale * 2) >= min_size[1]):
+		scale *= 2
+	return scale
+
+@functools.lru_cache(maxsize=8)
+def _resize_indices(shape, size):
+	"""Source row and column indices for _resize_nearest(), computed once per frame/output size"""
+	height, width = shape
+	rows = np.arange(size[1]) * height // size[1]
+	cols = np.arange(size[0]) * width // size[0]
+	return rows[:, None], cols
+
+def _resize_nearest(arr, size):
+	"""Nearest-neighbour resize of a 2-D array to size (width, height)"""
+	rows, cols = _resize_indices(arr.shape, tuple(size))
+	return arr[rows, cols]
+
+def decode_grayscale(frame_bytes, downscale=1, size=None):
+	"""
+	Decode a JPEG frame to a grayscale numpy array.
+
+	Colour JPEGs are treated as their Y (luma) plane only. Uses libjpeg-turbo
+	(PyTurboJPEG) when available, decoding straight to a single grayscale
+	plane. Falls back to OpenCV, then PIL. Downscaling is done
+	by the JPEG decoder itself (DCT scaling), so most of the IDCT work is
+	skipped rather than performed and thrown away.
+
+	Safe to call from several threads at once: libjpeg-turbo uses a fresh
+	decompressor handle per call and both backends release the GIL while
+	decoding. Callers should not hold a lock around it (see
+	MotionDetector.check_motion) or decodes are serialized again.
+
+	Args:
+		frame_bytes: Frame as JPEG bytes
+		downscale: Reduce each dimension by this factor (1, 2, 4 or 8).
+			Frames are never scaled below MOTION_MIN_DECODE_WIDTH pixels wide.
+		size: Optional fixed output size as (width, height), used instead of
+			downscale. The frame is decoded at the smallest DCT scale that is
+			still at least this big, then nearest-neighbour resized to it, so
+			the result is the same size whatever the camera resolution.
+
+	Returns:
+		2-D uint8 numpy array of shape (height, width)
+
+	Raises:
+		OSError: If the frame cannot be decoded
+	"""
+	if size is None:
+		return _decode_grayscale(frame_bytes, downscale, (MOTION_MIN_DECODE_WIDTH, 0))
+
+	arr = _decode_grayscale(frame_bytes, 8, size)
+	if arr.shape != (size[1], size[0]):
+		arr = _resize_nearest(arr, size)
+	return arr
+
+def _decode_grayscale(frame_bytes, downscale, min_size):
+	"""decode_grayscale() at up to 1/downscale size, keeping at least min_size (width, height)"""
+	if turbo_jpeg is not None:
+		try:
+			width, height = turbo_jpeg.decode_header(frame_bytes)[:2]
+			scale = _decode_scale(width, height, downscale, min_size)
+			scaling_factor = (1, scale) if scale > 1 else None
+			return turbo_jpeg.decode(frame_bytes, pixel_format=TJPF_GRAY, scaling_factor=scaling_factor)[:, :, 0]
+		except OSError:
+			# Let the other decoders have a go before giving up on the frame
+			pass
+
+	if cv2 is not None:
+		# imdecode has no header-only read, so start at the requested scale and
+		# back off if that took the frame below the minimum size
+		buf = np.frombuffer(frame_bytes, dtype=np.uint8)
+		scale = downscale
+		while True:
+			arr = cv2.imdecode(buf, CV2_REDUCED_GRAYSCALE[scale])
+			if arr is None or scale == 1 or (arr.shape[1] >= min_size[0] and arr.shape[0] >= min_size[1]):
+				break
+			scale //= 2
+		if arr is not None:
+			return arr
+
+	img = Image.open(io.BytesIO(frame_bytes))
+	scale = _decode_scale(img.width, img.height, downscale, min_size)
+	# Requesting 'L' makes libjpeg output just the Y (luma) plane of a colour
+	# JPEG, so no RGB decode followed by an RGB->L conversion
+	img.draft('L', (img.width // scale, img.height // scale))
+	if img.mode != 'L':
+		# Non-YCbCr JPEGs (e.g. CMYK) that draft() cannot map to 'L'
+		img = img.convert('L')
+	return np.asarray(img, dtype=np.uint8)
+
+def allocate_compare_buffers(shape):
+	"""
+	Allocate scratch buffers for compare_arrays()/compare_arrays_sad().
+
+	Passing these to the compare functions lets a caller that compares
+	same-sized frames repeatedly (e.g. MotionDetector) do so without
+	allocating new arrays for every frame.
+
+	Args:
+		shape: Frame shape as (height, width)
+
+	Returns:
+		Tuple of (diff uint8, scratch uint8, mask bool) arrays
+	"""
+	return (np.empty(shape, dtype=np.uint8),
+		np.empty(shape, dtype=np.uint8),
+		np.empty(shape, dtype=np.bool_))
+
+def _absdiff(arr1, arr2, buffers=None):
+	"""Absolute difference kept in uint8 (max - min never underflows)"""
+	if cv2 is not None:
+		# Single SIMD pass (NEON on the Pi) instead of three NumPy passes
+		return cv2.absdiff(arr1, arr2, dst=None if buffers is None else buffers[0])
+
+	if buffers is None:
+		return np.maximum(arr1, arr2) - np.minimum(arr1, arr2)
+
+	diff, scratch = buffers[0], buffers[1]
+	np.maximum(arr1, arr2, out=diff)
+	np.subtract(diff, np.minimum(arr1, arr2, out=scratch), out=diff)
+	return diff
+
+# Rows compared per band when compare_arrays() may stop early
+COMPARE_BAND_ROWS = 64
+
+def _pixel_threshold(threshold):
+	"""
+	Integer equivalent of a pixel difference threshold, or None if every pixel passes.
+
+	uint8 differences are whole numbers, so diff > threshold is the same test
+	as diff > floor(threshold). Comparing against an integer keeps the
+	comparison in uint8; a float threshold would make NumPy widen every
+	pixel to float64 first.
+	"""
+	threshold = math.floor(threshold)
+	if threshold < 0:
+		return None
+	return min(threshold, 255)
+
+def _count_changed(arr1, arr2, threshold, buffers=None):
+	"""Number of pixels that changed more than threshold (see _pixel_threshold)"""
+	if threshold is None:
+		return arr1.size
+
+	diff = _absdiff(arr1, arr2, buffers)
+	if cv2 is not None:
+		mask = cv2.compare(diff, threshold, cv2.CMP_GT, dst=None if buffers is None else buffers[1])
+		return cv2.countNonZero(mask)
+
+	if buffers is None:
+		mask = diff > threshold
+	else:
+		mask = np.greater(diff, threshold, out=buffers[2])
+	# A plain int: NumPy 2 returns np.int64, which would make the percentages
+	# np.float64, and orjson refuses to serialise those in /motion/status
+	return int(np.count_nonzero(mask))
+
+def compare_arrays(arr1, arr2, threshold=5.0, buffers=None, stop_at=None):
+	"""
+	Compare two decoded grayscale frames and return percentage of pixels changed.
+
+	Args:
+		arr1: First frame as 2-D uint8 numpy array
+		arr2: Second frame as 2-D uint8 numpy array
+		threshold: Pixel difference threshold (0-255) to consider a pixel changed
+		buffers: Optional scratch buffers from allocate_compare_buffers()
+		stop_at: Optional percentage to stop at. Frames are compared in bands
+			of COMPARE_BAND_ROWS rows and the remaining bands are skipped once
+			this much of the frame has changed, so the result is then only a
+			lower bound (but still >= stop_at).
+
+	Returns:
+		Float percentage of pixels changed (0.0-100.0)
+		Returns 0.0 if the frames have different dimensions
+	"""
+	if arr1.shape != arr2.shape:
+		# Lazy %-formatting: called per frame, and DEBUG is usually off
+		logger.debug("Cannot compare frames of different sizes: %s vs %s", arr1.shape, arr2.shape)
+		return 0.0
+
+	threshold = _pixel_threshold(threshold)
+	if stop_at is None or arr1.shape[0] <= COMPARE_BAND_ROWS:
+		return _count_changed(arr1, arr2, threshold, buffers) * 100.0 / arr1.size
+
+	changed_pixels = 0
+	stop_count = stop_at * arr1.size / 100.0
+	for start in range(0, arr1.shape[0], COMPARE_BAND_ROWS):
+		rows = slice(start, start + COMPARE_BAND_ROWS)
+		band_buffers = None if buffers is None else tuple(buf[rows] for buf in buffers)
+		changed_pixels += _count_changed(arr1[rows], arr2[rows], threshold, band_buffers)
+		if changed_pixels >= stop_count:
+			break
+
+	return changed_pixels * 100.0 / arr1.size
+
+def compare_arrays_sad(arr1, arr2, buffers=None):
+	"""
+	Compare two decoded grayscale frames by sum of absolute differences (SAD).
+
+	Cheaper than compare_arrays() as there is no per-pixel threshold, but
+	measures how much the frame changed on average rather than how much of
+	it changed: a small, high-contrast object scores lower than with
+	compare_arrays().
+
+	Args:
+		arr1: First frame as 2-D uint8 numpy array
+		arr2: Second frame as 2-D uint8 numpy array
+		buffers: Optional scratch buffers from allocate_compare_buffers()
+
+	Returns:
+		Mean absolute difference as a percentage of full scale (0.0-100.0)
+		Returns 0.0 if the frames have different dimensions
+	"""
+	if arr1.shape != arr2.shape:
+		# Lazy %-formatting: called per frame, and DEBUG is usually off
+		logger.debug("Cannot compare frames of different sizes: %s vs %s", arr1.shape, arr2.shape)
+		return 0.0
+
+	diff = _absdiff(arr1, arr2, buffers)
+	return int(diff.sum(dtype=np.uint64)) * 100.0 / (255 * diff.size)
+
+def compare_arrays_three_frame(arr0, arr1, arr2, threshold=5.0):
+	"""
+	Three-frame differencing: percentage of pixels that moved in the middle frame.
+
+	A pixel counts if it changed from arr0 to arr1 and from arr1 to arr2, but
+	not between arr0 and arr2, i.e. something passed through it in arr1. A
+	global flicker or exposure ripple that persists also shows up in the
+	arr0/arr2 difference and is ignored, so there are fewer false positives
+	than with compare_arrays(). An object that appears and then stays still
+	is not counted.
+
+	Args:
+		arr0: Oldest frame as 2-D uint8 numpy array
+		arr1: Middle frame as 2-D uint8 numpy array
+		arr2: Newest frame as 2-D uint8 numpy array
+		threshold: Pixel difference threshold (0-255) to consider a pixel changed
+
+	Returns:
+		Float percentage of pixels changed (0.0-100.0)
+		Returns 0.0 if the frames have different dimensions
+	"""
+	if not arr0.shape == arr1.shape == arr2.shape:
+		logger.debug("Cannot compare frames of different sizes: %s, %s, %s", arr0.shape, arr1.shape, arr2.shape)
+		return 0.0
+
+	threshold = _pixel_threshold(threshold)
+	if threshold is None:
+		# Every pixel also "changed" between arr0 and arr2
+		return 0.0
+
+	mask = _absdiff(arr0, arr1) > threshold
+	mask &= _absdiff(arr1, arr2) > threshold
+	mask &= _absdiff(arr0, arr2) <= threshold
+	return int(np.count_nonzero(mask)) * 100.0 / arr1.size
+
 def compare_frames(frame1_bytes, frame2_bytes, threshold=5.0):
 	"""
 	Compare two JPEG frames and return percentage of pixels changed.
@@ -89,30 +450,16 @@ def compare_frames(frame1_bytes, frame2_bytes, threshold=5.0):
 	if frame1_bytes is None or frame2_bytes is None:
 		return 0.0
 
-	try:
-		# Load images from bytes
-		img1 = Image.open(io.BytesIO(frame1_bytes))
-		img2 = Image.open(io.BytesIO(frame2_bytes))
-
-		# Convert to grayscale for efficiency
-		img1_gray = img1.convert('L')
-		img2_gray = img2.convert('L')
-
-		# Convert to numpy arrays for fast computation
-		arr1 = np.array(img1_gray, dtype=np.int16)
-		arr2 = np.array(img2_gray, dtype=np.int16)
-
-		# Calculate absolute difference
-		diff = np.abs(arr1 - arr2)
-
-		# Count pixels that changed more than threshold
-		changed_pixels = np.sum(diff > threshold)
-
-		# Calculate percentage
-		total_pixels = arr1.size
-		percentage = (changed_pixels / total_pixels) * 100.0
+	# Identical input (e.g. a re-submitted frame) cannot differ; bytes
+	# equality is a length check plus memcmp, far cheaper than two decodes
+	if frame1_bytes is frame2_bytes or frame1_bytes == frame2_bytes:
+		return 0.0
 
-		return percentage
+	try:
+		# Decode to grayscale numpy arrays for fast computation
+		arr1 = decode_grayscale(frame1_bytes)
+		arr2 = decode_grayscale(frame2_bytes)
+		return compare_arrays(arr1, arr2, threshold)
 
 	except Exception as e:
 		logger.error(f"Frame comparison error: {e}")
@@ -128,25 +475,19 @@ def save_motion_snapshot(frame_bytes):
 	Returns:
 		Timestamp of saved snapshot, or None if save failed
 	"""
-	global snapshot_history
-
 	if not MOTION_SNAPSHOT_ENABLED or frame_bytes is None:
 		return None
 
 	try:
-		import time
 		timestamp = time.time()
 
-		# Thread-safe append to snapshot history
+		# Thread-safe append to snapshot history (the deque evicts the oldest
+		# snapshot itself once the limit is reached)
 		with snapshot_lock:
 			snapshot_history.append((timestamp, frame_bytes))
 
-			# Cleanup old snapshots if limit is set
-			if MOTION_SNAPSHOT_LIMIT > 0 and len(snapshot_history) > MOTION_SNAPSHOT_LIMIT:
-				# Remove oldest snapshots
-				snapshot_history = snapshot_history[-MOTION_SNAPSHOT_LIMIT:]
-
-		logger.info(f"Snapshot saved to RAM: {len(frame_bytes)} bytes, total snapshots: {len(snapshot_history)}")
+		if logger.isEnabledFor(logging.INFO):
+			logger.info(f"Snapshot saved to RAM: {len(frame_bytes)} bytes, total snapshots: {len(snapshot_history)}")
 		return timestamp
 
 	except Exception as e:
@@ -155,40 +496,90 @@ def save_motion_snapshot(frame_bytes):
 
 # Motion detection state machine
 class MotionDetector:
-	"""Thread-safe motion detection state machine"""
+	"""
+	Thread-safe motion detection state machine.
+
+	state_lock guards state transitions only; JPEG decoding happens before
+	it is taken so that decodes from concurrent callers can run in parallel,
+	and status reads (get_status, is_motion_active) do not take it at all.
+	"""
 
 	# States
 	STATE_IDLE = "idle"
 	STATE_MOTION_DETECTED = "motion_detected"
 	STATE_COOLDOWN = "cooldown"
 
-	def __init__(self, threshold=5.0, cooldown_seconds=5.0):
+	# Touched on every frame; slots avoid a per-instance __dict__
+	__slots__ = (
+		'threshold', 'cooldown_seconds', 'downscale', 'fast_sad', 'thumbnail_size', 'size_skip_ratio',
+		'three_frame', 'state', 'state_lock',
+		'_cooldown_ns', 'motion_event_count', '_last_motion_ns', 'last_change_percentage',
+		'older_array', 'previous_array', 'baseline_array', '_compare_buffers', '_last_decoded'
+	)
+
+	def __init__(self, threshold=5.0, cooldown_seconds=5.0, downscale=4, fast_sad=False, thumbnail_size=None,
+			size_skip_ratio=0.0, three_frame=False):
 		"""
 		Initialize motion detector.
 
 		Args:
 			threshold: Percentage change threshold to trigger motion (0-100)
 			cooldown_seconds: Seconds to wait before detecting motion again
+			downscale: Decode frames at 1/downscale size (1, 2, 4 or 8)
+			fast_sad: Measure change as mean absolute difference (see
+				compare_arrays_sad) instead of percentage of pixels changed
+			thumbnail_size: Optional fixed (width, height) to compare frames at,
+				e.g. (160, 120), instead of a downscale factor (see
+				decode_grayscale)
+			size_skip_ratio: While idle, skip decoding and comparing a JPEG frame
+				whose size is within this fraction (e.g. 0.02) of the last
+				compared frame's size. 0 disables the check. Cheap, but a small
+				moving object may barely change the JPEG size, so this trades
+				sensitivity for CPU.
+			three_frame: Detect motion start with three-frame differencing (see
+				compare_arrays_three_frame), which ignores most lighting flicker
+				and exposure changes. Cannot be combined with fast_sad.
 		"""
+		if downscale not in (1, 2, 4, 8):
+			raise ValueError(f"downscale must be 1, 2, 4 or 8, got {downscale}")
+		if fast_sad and three_frame:
+			raise ValueError("fast_sad and three_frame cannot be combined")
+
 		self.threshold = threshold
 		self.cooldown_seconds = cooldown_seconds
+		self._cooldown_ns = int(cooldown_seconds * 1e9)
+		self.downscale = downscale
+		self.fast_sad = fast_sad
+		self.thumbnail_size = tuple(thumbnail_size) if thumbnail_size is not None else None
+		self.size_skip_ratio = size_skip_ratio
+		self.three_frame = three_frame
 
 		self.state = self.STATE_IDLE
 		self.state_lock = threading.Lock()
 
 		self.motion_event_count = 0
-		self.last_motion_time = None
+		self._last_motion_ns = None  # time.monotonic_ns() of the last motion frame
 		self.last_change_percentage = 0.0
 
-		self.previous_frame = None
-		self.baseline_frame = None  # Frame to compare against when detecting motion end
+		# Decoded grayscale arrays, so each incoming JPEG is decoded only once
+		self.older_array = None  # Frame before previous_array (three-frame differencing)
+		self.previous_array = None
+		self.baseline_array = None  # Frame to compare against when detecting motion end
+		# Allocated once the decoded frame size is known: up front for a fixed
+		# thumbnail size, otherwise on the first comparison
+		self._compare_buffers = None
+		if self.thumbnail_size is not None:
+			self._compare_buffers = allocate_compare_buffers((self.thumbnail_size[1], self.thumbnail_size[0]))
+		self._last_decoded = (None, None)  # (JPEG bytes, decoded array) of the last frame
 
 	def check_motion(self, current_frame_bytes):
 		"""
 		Check if motion is detected in current frame.
 
 		Args:
-			current_frame_bytes: Current frame as JPEG bytes
+			current_frame_bytes: Current frame as JPEG bytes, or an already
+				decoded 2-D uint8 grayscale array (e.g. from MotionFrameOutput),
+				which is compared as is
 
 		Returns:
 			Tuple of (motion_detected: bool, change_percentage: float)
@@ -196,136 +587,226 @@ class MotionDetector:
 		if current_frame_bytes is None:
 			return False, 0.0
 
+		# One clock read per frame, used for every cooldown check and motion
+		# timestamp below (the frame's arrival time)
+		now_ns = time.monotonic_ns()
+
+		# Still in cooldown, don't trigger (no decode or comparison needed).
+		# Unlocked read is only used to skip work; it is re-checked below.
+		if self.state == self.STATE_COOLDOWN and not self._is_cooldown_expired(now_ns):
+			return False, self.last_change_percentage
+
+		# Decode outside the lock: it is by far the most expensive step and
+		# only depends on the incoming frame, so concurrent callers (and
+		# status readers) are not serialized behind it.
+		# A static scene often yields byte-identical JPEGs back to back; reuse
+		# the previous decode then (a memcmp is far cheaper than a decode).
+		last_bytes, last_array = self._last_decoded
+		if not isinstance(current_frame_bytes, (bytes, bytearray, memoryview)):
+			current_array = current_frame_bytes
+		elif (self.size_skip_ratio and self.state == self.STATE_IDLE and last_bytes is not None
+				and abs(len(current_frame_bytes) - len(last_bytes)) < self.size_skip_ratio * len(last_bytes)):
+			# JPEG size barely changed since the last compared frame, which
+			# stays the reference, so slow changes still add up
+			return False, 0.0
+		elif last_bytes is not None and (current_frame_bytes is last_bytes or current_frame_bytes == last_bytes):
+			current_array = last_array
+		else:
+			try:
+				current_array = decode_grayscale(current_frame_bytes, self.downscale, self.thumbnail_size)
+			except Exception as e:
+				logger.error(f"Frame decode error: {e}")
+				return False, 0.0
+			self._last_decoded = (current_frame_bytes, current_array)
+
 		with self.state_lock:
+			if self.state == self.STATE_COOLDOWN and not self._is_cooldown_expired(now_ns):
+				return False, self.last_change_percentage
+
 			# Need a previous frame to compare
-			if self.previous_frame is None:
-				self.previous_frame = current_frame_bytes
-				self.baseline_frame = current_frame_bytes
+			if self.previous_array is None:
+				self.previous_array = current_array
+				self.baseline_array = current_array
 				return False, 0.0
 
-			# Check if we're in cooldown
+			# Cooldown expired, fall through to check if this frame triggers new motion
 			if self.state == self.STATE_COOLDOWN:
-				if self._is_cooldown_expired():
-					self.state = self.STATE_IDLE
-					self.baseline_frame = current_frame_bytes
-					# Fall through to check if this frame triggers new motion
-				else:
-					# Still in cooldown, don't trigger (no comparison needed)
-					return False, self.last_change_percentage
+				self.state = self.STATE_IDLE
+				self.baseline_array = current_array
 
 			# Handle state-specific frame comparisons
 			if self.state == self.STATE_IDLE:
-				# Compare with previous frame to detect motion start
-				change_percentage = compare_frames(self.previous_frame, current_frame_bytes)
+				# Compare with previous frame to detect motion start. Only the
+				# decision matters here, so the compare may stop once the
+				# threshold is reached (reported percentage is then a lower bound)
+				if self.three_frame:
+					change_percentage = self._compare_three_frame(current_array)
+				else:
+					change_percentage = self._compare(self.previous_array, current_array, stop_at=self.threshold)
 				self.last_change_percentage = change_percentage
-				self.previous_frame = current_frame_bytes
+				self.older_array = self.previous_array
+				self.previous_array = current_array
 
 				# Check if motion started
 				if change_percentage >= self.threshold:
 					# New motion detected!
 					self.state = self.STATE_MOTION_DETECTED
 					self.motion_event_count += 1
-					self.last_motion_time = time.time()
+					self._last_motion_ns = now_ns
 					return True, change_percentage
 				else:
 					return False, change_percentage
 
 			elif self.state == self.STATE_MOTION_DETECTED:
 				# Compare with baseline to detect motion end (optimization: single comparison)
-				baseline_change = compare_frames(self.baseline_frame, current_frame_bytes)
+				baseline_change = self._compare(self.baseline_array, current_array)
 				self.last_change_percentage = baseline_change
-				self.previous_frame = current_frame_bytes
+				self.older_array = self.previous_array
+				self.previous_array = current_array
 
 				if baseline_change < self.threshold:
 					# Returned to baseline, motion ended
 					self.state = self.STATE_COOLDOWN
-					self.last_motion_time = time.time()
+					self._last_motion_ns = now_ns
 					return False, baseline_change
 				else:
 					# Still away from baseline (motion ongoing)
-					self.last_motion_time = time.time()
+					self._last_motion_ns = now_ns
 					return True, baseline_change
 
 			return False, self.last_change_percentage
 
-	def _is_cooldown_expired(self):
-		"""Check if cooldown period has expired"""
-		if self.last_motion_time is None:
+	def _compare(self, previous, current, stop_at=None):
+		"""Percentage change between two decoded frames using the configured metric"""
+		buffers = self._compare_buffers
+		if buffers is None or buffers[0].shape != current.shape:
+			buffers = self._compare_buffers = allocate_compare_buffers(current.shape)
+
+		if self.fast_sad:
+			return compare_arrays_sad(previous, current, buffers)
+		return compare_arrays(previous, current, buffers=buffers, stop_at=stop_at)
+
+	def _compare_three_frame(self, current):
+		"""Three-frame change ending at current, or 0.0 until there are three frames of the same size"""
+		if self.older_array is None or self.older_array.shape != current.shape:
+			return 0.0
+		return compare_arrays_three_frame(self.older_array, self.previous_array, current)
+
+	def _is_cooldown_expired(self, now_ns):
+		"""Check if cooldown period has expired at now_ns (a time.monotonic_ns() reading)"""
+		last_motion_ns = self._last_motion_ns
+		if last_motion_ns is None:
 			return True
-		elapsed = time.time() - self.last_motion_time
-		return elapsed >= self.cooldown_seconds
+		return now_ns - last_motion_ns >= self._cooldown_ns
+
+	@property
+	def last_motion_time(self):
+		"""Wall-clock time (epoch seconds) of the last motion frame, or None"""
+		last_motion_ns = self._last_motion_ns
+		if last_motion_ns is None:
+			return None
+		return time.time() - (time.monotonic_ns() - last_motion_ns) / 1e9
 
 	def get_status(self):
 		"""
 		Get current motion detection status.
 
+		Reads are not locked: each field is read atomically, but a call that
+		races with check_motion() may mix values from before and after that
+		frame's update. Status is informational, so this is preferred over
+		making every poll wait for an in-progress frame.
+
 		Returns:
 			Dict with status information (thread-safe)
 		"""
-		with self.state_lock:
-			return {
-				"state": self.state,
-				"motion_event_count": self.motion_event_count,
-				"last_motion_time": self.last_motion_time,
-				"last_change_percentage": self.last_change_percentage,
-				"threshold": self.threshold,
-				"cooldown_seconds": self.cooldown_seconds
-			}
+		return {
+			"state": self.state,
+			"motion_event_count": self.motion_event_count,
+			"last_motion_time": self.last_motion_time,
+			"last_change_percentage": self.last_change_percentage,
+			"threshold": self.threshold,
+			"cooldown_seconds": self.cooldown_seconds,
+			"metric": "sad" if self.fast_sad else "three_frame" if self.three_frame else "pixels"
+		}
 
 	def is_motion_active(self):
-		"""Check if motion is currently being detected (thread-safe)"""
-		with self.state_lock:
-			return self.state == self.STATE_MOTION_DETECTED
+		"""Check if motion is currently being detected (thread-safe, lock-free read)"""
+		return self.state == self.STATE_MOTION_DETECTED
 
-# Background monitoring thread for motion detection and performance stats
-def monitoring_loop():
-	"""Monitor stream frames for motion detection and log performance"""
-	global current_frame, motion_detector, streaming_output, stream_fps
-	frame_count = 0
-	last_perf_log = time.time()
-	total_frame_size = 0
+# Run motion detection on every Nth stream frame (set by --motion-sample-every)
+MOTION_SAMPLE_EVERY = 1
 
-	logger.info(f"MJPEG streaming started with quality={JPEG_QUALITY}")
+# Background thread for motion detection
+def motion_loop():
+	"""
+	Run motion detection on the latest stream frame.
+
+	Runs on its own thread so slow detection never delays the stream stats:
+	like a stream client, it only ever picks up the newest
+	frame, so frames it cannot keep up with are simply skipped.
+	"""
+	seq = 0
+	last_checked_seq = 0
 
 	while True:
 		try:
-			# Wait for a new frame from the stream
-			with streaming_output.condition:
-				streaming_output.condition.wait()
-				frame_bytes = streaming_output.frame
+			seq, frame_bytes = streaming_output.wait_for_frame(seq)
 
-			if frame_bytes is None:
+			# Count published frames, not wakeups: when detection falls behind,
+			# one wakeup can cover several frames, and the sampling interval
+			# must not stretch beyond MOTION_SAMPLE_EVERY
+			if seq - last_checked_seq < MOTION_SAMPLE_EVERY:
 				continue
+			last_checked_seq = seq
+
+			# Prefer the camera's resized luma plane over decoding the JPEG
+			motion_frame = motion_output.frame if motion_output is not None else frame_bytes
+			motion_detected, change_pct = motion_detector.check_motion(motion_frame)
+
+			# Log motion events. Runs for every frame, so only build the
+			# messages when they will actually be emitted
+			if motion_detected:
+				if logger.isEnabledFor(logging.INFO):
+					logger.info(f"Motion detected! Change: {change_pct:.2f}%, Event #{motion_detector.motion_event_count}")
+
+				# Save snapshot if enabled
+				if MOTION_SNAPSHOT_ENABLED:
+					save_motion_snapshot(frame_bytes)
+			elif logger.isEnabledFor(logging.DEBUG):
+				# Log motion ended only when state changes from motion_detected to cooldown
+				if motion_detector.state == MotionDetector.STATE_COOLDOWN and change_pct < motion_detector.threshold:
+					logger.debug(f"Motion ended. Change: {change_pct:.2f}%")
 
-			# Update legacy current_frame for /webcam.jpg compatibility
-			with frame_lock:
-				current_frame = frame_bytes
+		except Exception as e:
+			logger.error(f"Motion detection error: {e}")
+			time.sleep(1)
 
-			total_frame_size += len(frame_bytes)
+# Background monitoring thread for performance stats
+def monitoring_loop():
+	"""Log stream performance (frame rate and size)"""
+	global stream_fps
+	frame_count = 0
+	last_perf_log = time.time()
+	total_frame_size = 0
+	seq = 0
 
-			# Check for motion if enabled
-			if motion_detector is not None:
-				motion_detected, change_pct = motion_detector.check_motion(frame_bytes)
+	logger.info(f"MJPEG streaming started with quality={JPEG_QUALITY}")
 
-				# Log motion events
-				if motion_detected:
-					status = motion_detector.get_status()
-					logger.info(f"Motion detected! Change: {change_pct:.2f}%, Event #{status['motion_event_count']}")
+	while True:
+		try:
+			# Wait for a new frame from the stream. The timeout keeps the stats
+			# going (down to 0 FPS) if the camera stops delivering frames
+			seq, frame_bytes = streaming_output.wait_for_frame(seq, timeout=5.0)
 
-					# Save snapshot if enabled
-					if MOTION_SNAPSHOT_ENABLED:
-						save_motion_snapshot(frame_bytes)
-				else:
-					# Log motion ended only when state changes from motion_detected to cooldown
-					status = motion_detector.get_status()
-					if status['state'] == MotionDetector.STATE_COOLDOWN and change_pct < motion_detector.threshold:
-						logger.debug(f"Motion ended. Change: {change_pct:.2f}%")
+			if frame_bytes is not None:
+				total_frame_size += len(frame_bytes)
+				frame_count += 1
 
 			# Performance logging every 5 seconds
-			frame_count += 1
-			if time.time() - last_perf_log >= 5.0:
-				avg_size = total_frame_size / frame_count / 1024  # KB
-				actual_fps = frame_count / (time.time() - last_perf_log)
+			now = time.time()
+			if now - last_perf_log >= 5.0:
+				avg_size = total_frame_size / frame_count / 1024 if frame_count else 0.0  # KB
+				actual_fps = frame_count / (now - last_perf_log)
 
 				# Update global FPS metric
 				with fps_lock:
@@ -333,14 +814,202 @@ def monitoring_loop():
 
 				logger.info(f"Stream Performance: {actual_fps:.1f} FPS | Avg Size: {avg_size:.1f}KB")
 				frame_count = 0
-				last_perf_log = time.time()
+				last_perf_log = now
 				total_frame_size = 0
 
 		except Exception as e:
 			logger.error(f"Monitoring error: {e}")
 			time.sleep(1)
 
+# Directory files are served from (fixed at startup), with a trailing
+# separator so that sibling directories such as "/srv/piwebcam-old" don't
+# pass a prefix check against "/srv/piwebcam"
+DOC_ROOT = os.path.join(os.path.realpath(os.getcwd()), "")
+
+# Static files served from memory, loaded once by load_static_files()
+STATIC_FILES = ("webcam.html",)
+static_cache = {}  # filename -> bytes
+static_mtimes = {}  # filename -> st_mtime_ns of the cached copy
+
+def cache_static_file(name):
+	"""Read one static file into static_cache, recording its modification time"""
+	with open(name, "rb") as in_file:
+		static_mtimes[name] = os.fstat(in_file.fileno()).st_mtime_ns
+		static_cache[name] = in_file.read()
+
+def load_static_files():
+	"""Read the STATIC_FILES allowlist from the current directory into static_cache"""
+	for name in STATIC_FILES:
+		try:
+			cache_static_file(name)
+		except OSError as e:
+			logger.warning(f"Static file {name} not cached: {e}")
+	logger.info(f"Cached {len(static_cache)} static file(s) in memory")
+
+def refresh_static_file(name):
+	"""Re-read a cached static file if it changed on disk (keeps the cached copy on error)"""
+	try:
+		if os.stat(name).st_mtime_ns != static_mtimes.get(name):
+			cache_static_file(name)
+			logger.debug(f"Reloaded static file {name}")
+	except OSError as e:
+		logger.debug(f"Static file {name} not reloaded: {e}")
+
+@functools.lru_cache(maxsize=1)
+def expected_auth_token(user, password):
+	"""Base64 credentials a Basic Authorization header must carry, encoded once"""
+	return base64.b64encode(f"{user}:{password}".encode('utf-8'))
+
+def json_body(obj):
+	"""Encode a JSON response body compactly (no indentation or spaces between items)"""
+	if orjson is not None:
+		# Compact by default, and produces bytes directly
+		return orjson.dumps(obj)
+	return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+# CORS headers for cross-origin access, sent with every response
+CORS_HEADERS = (
+	("Access-Control-Allow-Origin", "*"),
+	("Access-Control-Allow-Methods", "GET, OPTIONS"),
+	("Access-Control-Allow-Headers", "Content-Type")
+)
+
+# Headers of each JPEG part of the /stream multipart response (% frame size)
+STREAM_PART_HEADER = b'--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+
+_CORS_HEADER_LINES = b''.join(f"{keyword}: {value}\r\n".encode('latin-1') for keyword, value in CORS_HEADERS)
+
+# Complete /webcam.jpg response headers (% Server, Date, ETag, frame size), so
+# the hot path formats one bytes template instead of building each header line.
+# no-cache makes clients revalidate with If-None-Match rather than reuse a frame
+FRAME_RESPONSE_HEADER = (
+	b'HTTP/1.1 200 OK\r\nServer: %s\r\nDate: %s\r\n'
+	b'ETag: %s\r\nCache-Control: no-cache\r\n'
+	b'Content-Type: image/jpeg\r\nContent-Length: %d\r\n'
+	+ _CORS_HEADER_LINES + b'\r\n'
+)
+
+# /webcam.jpg response when the client already has the latest frame (% Server, Date, ETag)
+FRAME_NOT_MODIFIED_HEADER = (
+	b'HTTP/1.1 304 Not Modified\r\nServer: %s\r\nDate: %s\r\n'
+	b'ETag: %s\r\nCache-Control: no-cache\r\n'
+	+ _CORS_HEADER_LINES + b'\r\n'
+)
+
+# Frame sequence numbers restart with the process, so ETags carry the start
+# time too; a client's ETag from a previous run then never matches
+_ETAG_PREFIX = f"{time.time_ns():x}"
+
+def frame_etag(seq):
+	"""
+	Args:
+		seq: StreamingOutput.seq of the frame
+
+	Returns:
+		Quoted ETag for the frame, e.g. '"17c3a...-42"'
+	"""
+	return f'"{_ETAG_PREFIX}-{seq}"'
+
+def etag_matches(if_none_match, etag):
+	"""
+	Check an If-None-Match header against an ETag.
+
+	Args:
+		if_none_match: Header value (a "*" or a comma-separated list of ETags), or None
+		etag: Quoted ETag of the current representation
+
+	Returns:
+		True if the client's copy is current and 304 can be sent
+	"""
+	if if_none_match is None:
+		return False
+	for candidate in if_none_match.split(','):
+		candidate = candidate.strip()
+		# Weak comparison, as If-None-Match requires
+		if candidate.startswith('W/'):
+			candidate = candidate[2:]
+		if candidate == etag or candidate == '*':
+			return True
+	return False
+
+_http_date = (None, b'')  # (second, formatted Date header value)
+
+def http_date():
+	"""
+	Current time formatted for an HTTP Date header.
+
+	Formatting is redone at most once a second rather than per response.
+
+	Returns:
+		Date as bytes, e.g. b'Sun, 06 Nov 1994 08:49:37 GMT'
+	"""
+	global _http_date
+	now = int(time.time())
+	second, value = _http_date
+	if second != now:
+		value = email.utils.formatdate(now, usegmt=True).encode('latin-1')
+		_http_date = (now, value)
+	return value
+
+def send_buffers(sock, buffers):
+	"""
+	Send several buffers with scatter-gather sendmsg() calls, no joining copy.
+
+	Args:
+		sock: Connected socket supporting sendmsg() (not an SSL socket)
+		buffers: Sequence of bytes-like objects, sent in order
+	"""
+	views = [memoryview(buf) for buf in buffers]
+	while views:
+		sent = sock.sendmsg(views)
+		# Drop what went out and resend the rest after a partial send
+		while views and sent >= len(views[0]):
+			sent -= len(views.pop(0))
+		if views:
+			views[0] = views[0][sent:]
+
+# Content-Type by file extension for static files
+CONTENT_TYPES = {
+	"html": "text/html",
+	"css": "text/css",
+	"jpg": "image/jpeg",
+	"jpeg": "image/jpeg",
+	"png": "image/png",
+	"svg": "image/svg+xml"
+}
+
 class SimpleCloudFileServer(BaseHTTPRequestHandler):
+	# Buffer responses so headers and a typical frame leave in one send()
+	# rather than one for the headers and another for the body. Flushed by
+	# BaseHTTPRequestHandler after each request, and per frame on /stream
+	wbufsize = 64 * 1024
+
+	# Keep connections open between requests, so clients polling
+	# /webcam.jpg or /health skip a TCP (and TLS) handshake per request.
+	# Needs a Content-Length on every response that isn't closed after it
+	protocol_version = 'HTTP/1.1'
+
+	# Seconds a connection may sit idle (or a send may block) before it is
+	# closed, so idle keep-alive clients don't hold a server thread forever
+	timeout = 60
+
+	# Kernel send buffer per connection, big enough for a whole frame
+	SEND_BUFFER_SIZE = 256 * 1024
+
+	def setup(self):
+		"""Set up the connection with Nagle's algorithm off and a larger send buffer"""
+		BaseHTTPRequestHandler.setup(self)
+		# Small writes (headers, short responses) go out at once instead of
+		# being held back waiting for an ACK. Not supported on every socket
+		# type, hence not disable_nagle_algorithm, which would raise
+		for level, option, value in (
+				(socket.IPPROTO_TCP, socket.TCP_NODELAY, True),
+				(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SEND_BUFFER_SIZE)):
+			try:
+				self.connection.setsockopt(level, option, value)
+			except OSError as e:
+				logger.debug(f"Could not set socket option {option}: {e}")
+
 	def log_request(self, code='-', size='-'):
 		"""Override to control request logging based on log level"""
 		# Only log requests if DEBUG level is enabled, or if it's an error
@@ -349,28 +1018,55 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 		elif isinstance(code, int) and code >= 400:
 			BaseHTTPRequestHandler.log_request(self, code, size)
 
-	def sendHeader(self, response=200, contentType="image/jpeg"):
+	def sendHeader(self, response=200, contentType="image/jpeg", contentLength=None):
 		self.send_response(response)
 		self.send_header("Content-type", contentType)
-		# CORS headers for cross-origin access
-		self.send_header("Access-Control-Allow-Origin", "*")
-		self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
-		self.send_header("Access-Control-Allow-Headers", "Content-Type")
+		if contentLength is not None:
+			self.send_header("Content-Length", str(contentLength))
+		else:
+			# Body length unknown: the client reads it until the connection closes
+			self.send_header("Connection", "close")
+		for keyword, value in CORS_HEADERS:
+			self.send_header(keyword, value)
 		self.end_headers()
 	
-	def contentTypeFrom(self, filename):
-		if filename.endswith("html"):
-			return "text/html"
-		elif filename.endswith("css"):
-			return "text/css"
-		elif filename.endswith("jpg") or filename.endswith("jpeg"):
-			return "image/jpeg"
-		elif filename.endswith("png"):
-			return "image/png"
-		elif filename.endswith("svg"):
-			return "image/svg+xml"
+	def sendBody(self, body, response=200, contentType="text/plain"):
+		"""Send a complete response whose body is already in memory, with its Content-Length"""
+		self.sendHeader(response=response, contentType=contentType, contentLength=len(body))
+		self.wfile.write(body)
+
+	def sendFrame(self, frame, seq):
+		"""
+		Send a JPEG frame as a complete 200 response, or 304 if the client
+		already has it (If-None-Match matches the frame's ETag).
+
+		Headers come from FRAME_RESPONSE_HEADER instead of send_response and
+		send_header. On plain TCP they leave with the frame in one sendmsg()
+		call, without copying the frame; SSL sockets have no sendmsg(), so
+		there they are joined with it for a single write.
+
+		Args:
+			frame: JPEG bytes
+			seq: Sequence number of the frame, for its ETag
+		"""
+		server = self.version_string().encode('latin-1')
+		etag = frame_etag(seq)
+		if etag_matches(self.headers.get('If-None-Match'), etag):
+			self.log_request(304)
+			self.wfile.write(FRAME_NOT_MODIFIED_HEADER % (server, http_date(), etag.encode('latin-1')))
+			return
+
+		self.log_request(200, len(frame))
+		header = FRAME_RESPONSE_HEADER % (server, http_date(), etag.encode('latin-1'), len(frame))
+		if isinstance(self.connection, socket.socket) and not isinstance(self.connection, ssl.SSLSocket):
+			# Anything already buffered must go out first
+			self.wfile.flush()
+			send_buffers(self.connection, (header, frame))
 		else:
-			return "application/octet-stream"
+			self.wfile.write(b''.join((header, frame)))
+
+	def contentTypeFrom(self, filename):
+		return CONTENT_TYPES.get(filename.rpartition(".")[2].lower(), "application/octet-stream")
 
 	def check_auth(self):
 		"""Check HTTP Basic Authentication. Returns True if authorized or auth disabled."""
@@ -387,31 +1083,50 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 			if auth_type.lower() != 'basic':
 				return False
 
-			# Decode credentials
-			decoded = base64.b64decode(auth_string).decode('utf-8')
-			username, password = decoded.split(':', 1)
-
-			# Verify credentials
-			return username == AUTH_USER and password == AUTH_PASS
+			# Compare the encoded credentials directly (constant time, no decode)
+			return hmac.compare_digest(auth_string.strip().encode('latin-1'),
+				expected_auth_token(AUTH_USER, AUTH_PASS))
 		except Exception:
 			return False
 
 	def send_auth_required(self):
 		"""Send 401 Unauthorized response with WWW-Authenticate header"""
+		body = b'401 Unauthorized'
 		self.send_response(401)
 		self.send_header('WWW-Authenticate', 'Basic realm="Webcam Access"')
 		self.send_header('Content-type', 'text/plain')
+		self.send_header('Content-Length', str(len(body)))
 		self.end_headers()
-		self.wfile.write(b'401 Unauthorized')
+		self.wfile.write(body)
 
 	def do_HEAD(self):
 		self.sendHeader()
 
 	def do_OPTIONS(self):
 		"""Handle CORS preflight requests"""
-		self.sendHeader(contentType="text/plain")
+		self.sendHeader(contentType="text/plain", contentLength=0)
 	
 	def do_GET(self):
+		# Most polled URL, so match it before the general endpoint dispatch
+		if self.path == "/webcam.jpg" or self.path.startswith("/webcam.jpg?"):
+			if not self.check_auth():
+				self.send_auth_required()
+				return
+
+			# Serve the latest stream frame from memory. It is always rebound
+			# to immutable bytes, never mutated, so one unlocked read gives a
+			# complete frame and the write below may then take as long as the
+			# client needs without holding up frame publishing
+			# seq is read first: _publish sets frame before seq, so the frame is
+			# never older than the seq (an ETag never claims a newer frame)
+			seq = streaming_output.seq
+			frame = streaming_output.frame
+			if frame is not None:
+				self.sendFrame(frame, seq)
+			else:
+				self.sendBody(b"Camera initializing, please wait", response=503, contentType="text/plain")
+			return
+
 		filename = (self.path[1:]).split("?")[0]
 
 		# Allow health endpoint without auth (for monitoring)
@@ -424,45 +1139,29 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 		if filename == "stream":
 			self.send_response(200)
 			self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
-			self.send_header('Access-Control-Allow-Origin', '*')
+			self.send_header('Connection', 'close')
+			for keyword, value in CORS_HEADERS:
+				self.send_header(keyword, value)
 			self.end_headers()
 			try:
+				seq = 0
 				while True:
-					with streaming_output.condition:
-						streaming_output.condition.wait()
-						frame = streaming_output.frame
-
-					if frame is None:
-						continue
-
-					self.wfile.write(b'--FRAME\r\n')
-					self.send_header('Content-Type', 'image/jpeg')
-					self.send_header('Content-Length', str(len(frame)))
-					self.end_headers()
-					self.wfile.write(frame)
-					self.wfile.write(b'\r\n')
+					seq, frame = streaming_output.wait_for_frame(seq)
+
+					# One write per part: the part headers are small and fixed, so
+					# joining them with the frame costs less than the extra
+					# send() calls of writing each piece separately
+					self.wfile.write(b''.join((STREAM_PART_HEADER % len(frame), frame, b'\r\n')))
+					self.wfile.flush()
 			except (BrokenPipeError, ConnectionResetError):
 				logger.debug("Client disconnected from stream")
 			except Exception as e:
 				logger.error(f"Stream error: {e}")
 			return
 
-		# Handle webcam requests - serve from memory (legacy, for compatibility)
-		if filename == "webcam.jpg":
-			with frame_lock:
-				if current_frame is not None:
-					self.sendHeader(contentType="image/jpeg")
-					self.wfile.write(current_frame)
-				else:
-					self.sendHeader(response=503, contentType="text/plain")
-					self.wfile.write(b"Camera initializing, please wait")
-			return
-
 		# Handle health check endpoint
 		if filename == "health":
-			import json
-			with frame_lock:
-				camera_ready = current_frame is not None
+			camera_ready = streaming_output.frame is not None
 
 			# Get current stream FPS
 			with fps_lock:
@@ -472,8 +1171,7 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 				"status": "ok",
 				"camera": {
 					"ready": camera_ready,
-					"resolution": f"{int(camera.resolution[0])}x{int(camera.resolution[1])}",
-					"framerate": float(camera.framerate)
+					**camera_info
 				},
 				"stream": {
 					"fps": round(current_fps, 1)
@@ -498,17 +1196,14 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 					"enabled": False
 				}
 
-			response_body = json.dumps(health_status, indent=2).encode('utf-8')
-			self.sendHeader(contentType="application/json")
-			self.wfile.write(response_body)
+			response_body = json_body(health_status)
+			self.sendBody(response_body, contentType="application/json")
 			return
 
 		# Handle detailed motion status endpoint
 		if filename == "motion/status":
-			import json
 			if motion_detector is None:
-				self.sendHeader(response=404, contentType="application/json")
-				self.wfile.write(json.dumps({"error": "Motion detection not enabled"}).encode('utf-8'))
+				self.sendBody(json_body({"error": "Motion detection not enabled"}), response=404, contentType="application/json")
 				return
 
 			status = motion_detector.get_status()
@@ -527,7 +1222,8 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 				"last_change_percentage": status['last_change_percentage'],
 				"config": {
 					"threshold": status['threshold'],
-					"cooldown_seconds": status['cooldown_seconds']
+					"cooldown_seconds": status['cooldown_seconds'],
+					"metric": status['metric']
 				},
 				"snapshot": {
 					"enabled": MOTION_SNAPSHOT_ENABLED,
@@ -538,16 +1234,14 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 				}
 			}
 
-			response_body = json.dumps(motion_status, indent=2).encode('utf-8')
-			self.sendHeader(contentType="application/json")
-			self.wfile.write(response_body)
+			response_body = json_body(motion_status)
+			self.sendBody(response_body, contentType="application/json")
 			return
 
 		# Handle latest motion snapshot endpoint
 		if filename == "motion/snapshot":
 			if motion_detector is None:
-				self.sendHeader(response=404, contentType="text/plain")
-				self.wfile.write(b"Motion detection not enabled")
+				self.sendBody(b"Motion detection not enabled", response=404, contentType="text/plain")
 				return
 
 			# Thread-safe read of latest snapshot from RAM
@@ -558,37 +1252,61 @@ class SimpleCloudFileServer(BaseHTTPRequestHandler):
 					latest_snapshot = None
 
 			if not MOTION_SNAPSHOT_ENABLED or latest_snapshot is None:
-				self.sendHeader(response=404, contentType="text/plain")
-				self.wfile.write(b"No snapshot available")
+				self.sendBody(b"No snapshot available", response=404, contentType="text/plain")
 				return
 
-			# Serve snapshot directly from RAM
-			self.sendHeader(contentType="image/jpeg")
-			self.wfile.write(latest_snapshot)
+			# Serve snapshot directly from RAM (already bytes, so no file read
+			# or copy is needed before the write)
+			self.sendBody(latest_snapshot, contentType="image/jpeg")
 			return
 
-		# Handle other file requests (like webcam.html)
+		# Cached static files (like webcam.html) are served without disk access.
+		# At DEBUG level, edits are picked up without a restart (one stat per request)
+		if filename in static_cache and logger.isEnabledFor(logging.DEBUG):
+			refresh_static_file(filename)
+		data = static_cache.get(filename)
+		if data is not None:
+			self.sendBody(data, contentType=self.contentTypeFrom(filename))
+			return
+
+		# Handle other file requests
 		try:
 			# Security: Prevent path traversal attacks
-			# Get absolute path and ensure it's within current directory
-			current_dir = os.path.abspath(os.getcwd())
-			requested_path = os.path.abspath(filename)
-
-			# Reject if path tries to escape current directory
-			if not requested_path.startswith(current_dir):
+			# Resolve against the document root (following symlinks, so a link
+			# pointing outside it is caught) and ensure it stays inside it
+			requested_path = os.path.realpath(os.path.join(DOC_ROOT, filename))
+
+			# Reject if path tries to escape the document root. The root itself
+			# ("/", "/.") resolves without the trailing separator; it is inside,
+			# and gets the directory 404 below
+			if not requested_path.startswith(DOC_ROOT) and requested_path != DOC_ROOT[:-1]:
 				logger.warning(f"Path traversal attempt blocked: {filename}")
-				self.sendHeader(response=403, contentType="text/plain")
-				self.wfile.write(b"403 Forbidden")
+				self.sendBody(b"403 Forbidden", response=403, contentType="text/plain")
 				return
 
-			with open(requested_path, "rb") as in_file:
-				data = in_file.read()
-				self.sendHeader(contentType=self.contentTypeFrom(filename))
-				self.wfile.write(data)
-		except (FileNotFoundError, IOError):
+			in_file = open(requested_path, "rb")
+		except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
 			logger.info(f"File not found: {filename}")
-			self.sendHeader(response=404, contentType="text/plain")
-			self.wfile.write(b"404 file not found")
+			self.sendBody(b"404 file not found", response=404, contentType="text/plain")
+			return
+		except PermissionError:
+			logger.warning(f"Permission denied: {filename}")
+			self.sendBody(b"403 Forbidden", response=403, contentType="text/plain")
+			return
+		except OSError as e:
+			# Anything else (e.g. out of file descriptors) is a server problem,
+			# not a missing file, so report it rather than answering 404
+			logger.error(f"Could not open {filename}: {type(e).__name__}: {e}")
+			self.sendBody(b"500 Internal Server Error", response=500, contentType="text/plain")
+			return
+
+		with in_file:
+			self.sendHeader(contentType=self.contentTypeFrom(filename),
+				contentLength=os.fstat(in_file.fileno()).st_size)
+			# Let the kernel copy the file to the socket (falls back to a
+			# read/send loop for TLS sockets)
+			self.wfile.flush()
+			self.connection.sendfile(in_file)
 
 def parse_args():
 	"""Parse command-line arguments"""
@@ -617,6 +1335,8 @@ Examples:
 		help='Camera framerate (default: 30)')
 	parser.add_argument('--quality', type=int, default=85,
 		help='JPEG quality 1-100, lower=faster encoding (default: 85)')
+	parser.add_argument('--no-video-denoise', action='store_true',
+		help='Turn off the camera\'s video denoise filter (less ISP work, smaller frames, noisier image)')
 	parser.add_argument('--no-auth', action='store_true',
 		help='Disable authentication even if WEBCAM_USER/WEBCAM_PASS are set')
 	parser.add_argument('--log-level', default='INFO',
@@ -638,16 +1358,37 @@ Examples:
 		help='Motion detection threshold percentage 0-100 (default: 5.0)')
 	parser.add_argument('--motion-cooldown', type=float, default=5.0,
 		help='Seconds between motion events (default: 5.0)')
+	parser.add_argument('--motion-sad', action='store_true',
+		help='Measure motion as mean pixel difference instead of pixels changed (faster, less sensitive to small objects)')
+	parser.add_argument('--motion-sample-every', type=int, default=1, metavar='N',
+		help='Check every Nth stream frame for motion (default: 1, every frame)')
+	parser.add_argument('--motion-size-skip', type=float, default=0.0, metavar='RATIO',
+		help='Skip comparing frames whose JPEG size changed by less than RATIO, e.g. 0.02 (default: 0, disabled)')
+	parser.add_argument('--motion-yuv', action='store_true',
+		help='Detect motion on small raw frames from a second camera port instead of decoding the JPEG stream (less CPU)')
+	parser.add_argument('--motion-three-frame', action='store_true',
+		help='Use three-frame differencing to ignore lighting flicker (cannot be combined with --motion-sad)')
 	parser.add_argument('--motion-snapshot', action='store_true',
 		help='Save snapshots to RAM when motion detected (default: disabled)')
 	parser.add_argument('--motion-snapshot-limit', type=int, default=0,
 		help='Max snapshots to keep in RAM, 0=unlimited (default: 0)')
 
-	return parser.parse_args()
+	args = parser.parse_args()
+	if args.motion_sample_every < 1:
+		parser.error(f"--motion-sample-every must be at least 1, got {args.motion_sample_every}")
+	return args
 
-def initialize_camera(resolution_str, framerate):
-	"""Initialize and configure camera"""
-	global camera, JPEG_QUALITY
+def initialize_camera(resolution_str, framerate, video_denoise=True):
+	"""
+	Initialize and configure camera
+
+	Args:
+		resolution_str: Resolution as WIDTHxHEIGHT
+		framerate: Frames per second
+		video_denoise: Keep the ISP's video denoise filter on. Off saves ISP
+			work and gives smaller JPEGs, at the cost of a noisier image
+	"""
+	global camera, camera_info, JPEG_QUALITY
 
 	# Parse resolution string
 	try:
@@ -674,15 +1415,23 @@ def initialize_camera(resolution_str, framerate):
 	camera = PiCamera()
 	camera.resolution = (width, height)
 	camera.framerate = framerate
+	camera.video_denoise = video_denoise
+
+	# Fixed for the life of the process; reading them back from the camera
+	# is an MMAL call, so /health reports this snapshot instead
+	camera_info = {
+		"resolution": f"{int(camera.resolution[0])}x{int(camera.resolution[1])}",
+		"framerate": float(camera.framerate)
+	}
 
 	# Camera warm-up time
 	time.sleep(2)
-	logger.info(f"Camera initialized: {width}x{height} @ {framerate}fps, quality={JPEG_QUALITY}")
+	logger.info(f"Camera initialized: {width}x{height} @ {framerate}fps, quality={JPEG_QUALITY}, video_denoise={video_denoise}")
 
 def main():
 	"""Main entry point"""
-	global HOST_NAME, PORT_NUMBER, AUTH_USER, AUTH_PASS, AUTH_ENABLED, motion_detector
-	global MOTION_SNAPSHOT_ENABLED, MOTION_SNAPSHOT_LIMIT, JPEG_QUALITY
+	global HOST_NAME, PORT_NUMBER, AUTH_USER, AUTH_PASS, AUTH_ENABLED, motion_detector, motion_output
+	global MOTION_SNAPSHOT_ENABLED, MOTION_SNAPSHOT_LIMIT, MOTION_SAMPLE_EVERY, JPEG_QUALITY, snapshot_history
 
 	# Parse command-line arguments
 	args = parse_args()
@@ -737,11 +1486,25 @@ def main():
 			logger.error(f"Motion threshold must be between 0 and 100, got {args.motion_threshold}")
 			sys.exit(1)
 
+		if args.motion_sad and args.motion_three_frame:
+			logger.error("--motion-sad and --motion-three-frame cannot be combined")
+			sys.exit(1)
+
+		MOTION_SAMPLE_EVERY = args.motion_sample_every
+
+		# Validate size skip ratio
+		if not 0 <= args.motion_size_skip < 1:
+			logger.error(f"Motion size skip ratio must be >= 0 and < 1, got {args.motion_size_skip}")
+			sys.exit(1)
+
 		motion_detector = MotionDetector(
 			threshold=args.motion_threshold,
-			cooldown_seconds=args.motion_cooldown
+			cooldown_seconds=args.motion_cooldown,
+			fast_sad=args.motion_sad,
+			size_skip_ratio=args.motion_size_skip,
+			three_frame=args.motion_three_frame
 		)
-		logger.info(f"Motion detection enabled: threshold={args.motion_threshold}%, cooldown={args.motion_cooldown}s")
+		logger.info(f"Motion detection enabled: threshold={args.motion_threshold}%, cooldown={args.motion_cooldown}s, metric={motion_detector.get_status()['metric']}, every {MOTION_SAMPLE_EVERY} frame(s)")
 
 		# Configure motion snapshots (in-memory storage)
 		if args.motion_snapshot:
@@ -752,22 +1515,40 @@ def main():
 
 			MOTION_SNAPSHOT_ENABLED = True
 			MOTION_SNAPSHOT_LIMIT = args.motion_snapshot_limit
+			snapshot_history = collections.deque(maxlen=MOTION_SNAPSHOT_LIMIT or None)
 			logger.info(f"Motion snapshots enabled: storage=RAM, limit={MOTION_SNAPSHOT_LIMIT if MOTION_SNAPSHOT_LIMIT > 0 else 'unlimited'}")
 	else:
 		logger.info("Motion detection disabled")
 
+	load_static_files()
+
 	# Initialize camera
-	initialize_camera(args.resolution, args.framerate)
+	initialize_camera(args.resolution, args.framerate, video_denoise=not args.no_video_denoise)
 
 	# Start MJPEG recording to streaming output
 	camera.start_recording(streaming_output, format='mjpeg', quality=JPEG_QUALITY)
 	logger.info(f"MJPEG recording started: quality={JPEG_QUALITY}")
 
-	# Start background monitoring thread for motion detection
+	# Have the camera resize and emit raw frames for motion detection.
+	# Splitter port 2 leaves port 1 (MJPEG) untouched
+	if motion_detector is not None and args.motion_yuv:
+		width, height = camera.resolution
+		motion_output = MotionFrameOutput((int(width) // motion_detector.downscale, int(height) // motion_detector.downscale))
+		camera.start_recording(motion_output, format='yuv', splitter_port=2, resize=motion_output.size)
+		logger.info(f"Motion frames: raw YUV at {motion_output.size[0]}x{motion_output.size[1]}")
+
+	# Start background monitoring thread for performance stats
 	monitoring_thread = threading.Thread(target=monitoring_loop, daemon=True)
 	monitoring_thread.start()
 	logger.info("Monitoring thread started")
 
+	# Motion detection gets its own thread, so it can fall behind without
+	# holding up anything else
+	if motion_detector is not None:
+		motion_thread = threading.Thread(target=motion_loop, daemon=True)
+		motion_thread.start()
+		logger.info("Motion detection thread started")
+
 	# Start HTTP server (threaded to handle multiple clients)
 	httpd = ThreadingHTTPServer((HOST_NAME, PORT_NUMBER), SimpleCloudFileServer)
 
@@ -795,6 +1576,8 @@ def main():
 	except KeyboardInterrupt:
 		logger.info("Received shutdown signal")
 	finally:
+		if motion_output is not None:
+			camera.stop_recording(splitter_port=2)
 		camera.stop_recording()
 		camera.close()
 		httpd.server_close()